@@ -2,9 +2,17 @@ import streamlit as st
 import json
 import google.generativeai as genai
 import os
-import random
+from collections import defaultdict
+from functools import reduce
+from operator import or_
 from dotenv import load_dotenv
+import numpy as np
+import pandas as pd
 import re
+import zlib
+from json_io import load_json, parse_json_response
+from product_filter import filter_rows
+from typing_extensions import TypedDict
 
 load_dotenv()
 
@@ -12,20 +20,148 @@ api_key = os.getenv("GEMINI_API_KEY")
 
 st.set_page_config(layout="wide", page_title="AI Style Advisor")
 
-if api_key:
-    genai.configure(api_key=api_key)
-else:
+if not api_key:
     st.error("Error: Google Gemini API key not configured.")
     st.warning("Ensure you have a `.env` file in the project root with `GOOGLE_API_KEY=YOUR_GEMINI_API_KEY`.")
     st.stop()
 
-model = genai.GenerativeModel('gemini-2.5-flash')
+
+class StylingResponse(TypedDict):
+    overall_styling_proposal: str
+    suggested_ids: list[int]
+
+
+@st.cache_resource
+def get_model(api_key):
+    """
+    Configures Gemini and creates the model once per process (and API key),
+    so its client and open connections are reused across Streamlit reruns.
+    """
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(
+        'gemini-2.5-flash',
+        generation_config=genai.GenerationConfig(response_mime_type="application/json",
+                                                 response_schema=StylingResponse))
+
+
+model = get_model(api_key)
+
+JSON_FENCE_PATTERN = re.compile(r'```json\n({.*?})\n```', re.DOTALL)
+
+PRODUCT_CONTEXT_TEMPLATE = """
+            Product {number}:
+            - Name: {name}
+            - Description: {description}
+            - Category: {category}
+            - Subcategory: {sub_category}
+            - Color: {color}
+            - Brand: {brand}
+            - Price: {price} {currency}
+            - Image URL: {image_url}
+            - Purchase Link: {purchase_link}
+            - Occasion Tags: {occasion_tags}
+            - Style Tags: {style_tags}
+            """
+
+PROMPT_VERSION = 2  # Bump when the model or response schema changes to invalidate cached responses.
+
+
+@st.cache_data(show_spinner=False, ttl=86400)
+def call_gemini(prompt_text, prompt_version):
+    """
+    Sends the prompt to Gemini and returns the response text.
+    Responses are cached for a day per (prompt, version), so repeating a search doesn't re-hit the API.
+    `prompt_version` is unused in the body; it has to be passed so it becomes part of the cache key.
+    """
+    return model.generate_content(prompt_text).text
+
 
 DATA_FILE = 'fashion_products_tagged.json'
-products_data = []
+
+
+def build_index(products, keys_for_product):
+    """
+    Builds an inverted index mapping each lowercased key to the set of product row ids having it.
+    """
+    index = defaultdict(set)
+    for i, product in enumerate(products):
+        for key in keys_for_product(product):
+            index[key.lower()].add(i)
+    return dict(index)
+
+
+def match_any(index, keys):
+    """
+    Returns the row ids matching at least one of the given keys.
+    """
+    return set().union(*(index.get(key.lower(), set()) for key in keys))
+
+
+def build_tag_bits(products, field):
+    """
+    Assigns each distinct lowercased tag its own bit and returns (bit per tag, uint64 tag mask per product).
+    Returns None if the vocabulary is too large to fit in 64 bits.
+    """
+    vocabulary = sorted({tag.lower() for p in products for tag in p.get(field, [])})
+    if len(vocabulary) > 64:
+        return None
+
+    bit_for_tag = {tag: 1 << i for i, tag in enumerate(vocabulary)}
+    row_bits = np.array([reduce(or_, (bit_for_tag[tag.lower()] for tag in p.get(field, [])), 0) for p in products],
+                        dtype=np.uint64)
+    return bit_for_tag, row_bits
+
+
+def encode_column(values):
+    """
+    Dictionary-encodes a lowercased string column into small integer codes plus the list of distinct values.
+    """
+    categorical = pd.Categorical(values.str.lower())
+    return categorical.codes, list(categorical.categories)
+
+
+@st.cache_resource
+def load_catalog(path, mtime):
+    """
+    Loads the products file together with everything derived from it: the columnar filter data and the form options.
+    Cached per process; `mtime` is part of the cache key so regenerated tags are picked up automatically.
+    """
+    products = load_json(path)
+    frame = pd.DataFrame(products, columns=['gender', 'category', 'color', 'price'])
+    gender_codes, gender_values = encode_column(frame['gender'])
+    category_codes, category_values = encode_column(frame['category'])
+    color_codes, color_values = encode_column(frame['color'])
+    occasion_bits = build_tag_bits(products, 'occasion_tags')
+    style_bits = build_tag_bits(products, 'style_tags')
+
+    occasion_tags = set().union(*(p.get('occasion_tags', ()) for p in products))
+    style_tags = set().union(*(p.get('style_tags', ()) for p in products))
+    genders = {p['gender'] for p in products} - {'unspecified gender'}
+    categories = {p['category'] for p in products} - {'unspecified category'}
+
+    return {
+        'products': products,
+        'gender_codes': gender_codes,
+        'gender_values': gender_values,
+        'category_codes': category_codes,
+        'category_values': category_values,
+        'color_codes': color_codes,
+        'color_values': color_values,
+        'prices': frame['price'].to_numpy(dtype=np.float32),
+        'occasion_bits': occasion_bits,
+        'style_bits': style_bits,
+        # Inverted indices are only needed when a tag vocabulary doesn't fit in a 64-bit mask.
+        'occasion_idx': build_index(products, lambda p: p.get('occasion_tags', [])) if occasion_bits is None else None,
+        'style_idx': build_index(products, lambda p: p.get('style_tags', [])) if style_bits is None else None,
+        'gender_options': ['Any'] + sorted(genders),
+        'category_options': ['Full outfit', 'Any'] + sorted(categories),
+        'occasion_tags': sorted(occasion_tags),
+        'style_tags': sorted(style_tags),
+    }
+
+
 try:
-    with open(DATA_FILE, 'r', encoding='utf-8') as f:
-        products_data = json.load(f)
+    catalog = load_catalog(DATA_FILE, os.path.getmtime(DATA_FILE))
 except FileNotFoundError:
     st.error(f"Error: Data file '{DATA_FILE}' not found. Please run `generate_tags_with_gemini.py` first.")
     st.stop()
@@ -33,46 +169,74 @@ except json.JSONDecodeError:
     st.error(f"Error: Failed to load '{DATA_FILE}'. Check if it's a valid JSON.")
     st.stop()
 
-def find_products_by_criteria(criteria, num_results=20):
-    """
-    Finds a pool of potential products based on criteria, leveraging occasion_tags and style_tags.
-    Returns a shuffled list of products.
-    """
-    found_products = []
-    for product in products_data:
-        match = True
+products_data = catalog['products']
 
-        if 'gender' in criteria and criteria['gender'] and criteria['gender'].lower() != 'any' and product[
-            'gender'].lower() != criteria['gender'].lower():
-            match = False
 
-        if 'category' in criteria and criteria['category'] and criteria['category'].lower() != 'any' and criteria[
-            'category'].lower() != 'full outfit':
-            if product['category'].lower() != criteria['category'].lower():
-                match = False
+def allowed_values(values, matches=None):
+    """
+    Returns a boolean lookup table saying which distinct encoded values satisfy `matches` (all of them if None).
+    """
+    if matches is None:
+        return np.ones(len(values), dtype=bool)
+    return np.array([matches(value) for value in values], dtype=bool)
 
-        if 'max_price' in criteria and product['price'] > criteria['max_price']:
-            match = False
 
-        if 'color' in criteria and criteria['color'] and criteria['color'].lower() != 'any':
-            if criteria['color'].lower() not in product['color'].lower():
-                match = False
+def tag_mask(tag_bits, index, tags):
+    """
+    Returns a boolean mask of the rows having at least one of the given tags (all rows if no tags are given).
+    Uses a single AND over the per-product bitmasks when available, falling back to the inverted index.
+    """
+    if not tags:
+        return np.ones(len(products_data), dtype=bool)
 
-        if 'occasion_tags' in criteria and criteria['occasion_tags']:
-            if not any(tag.lower() in [ot.lower() for ot in product.get('occasion_tags', [])] for tag in
-                       criteria['occasion_tags']):
-                match = False
+    if tag_bits is not None:
+        bit_for_tag, row_bits = tag_bits
+        required = np.uint64(reduce(or_, (bit_for_tag.get(tag.lower(), 0) for tag in tags), 0))
+        return (row_bits & required) != 0
 
-        if 'style_tags' in criteria and criteria['style_tags']:
-            if not any(tag.lower() in [st.lower() for st in product.get('style_tags', [])] for tag in
-                       criteria['style_tags']):
-                match = False
+    mask = np.zeros(len(products_data), dtype=bool)
+    mask[list(match_any(index, tags))] = True
+    return mask
 
-        if match:
-            found_products.append(product)
 
-    random.shuffle(found_products)
-    return found_products[:min(len(found_products), num_results)]
+def find_products_by_criteria(criteria, num_results=20, shuffle_round=0):
+    """
+    Finds a pool of potential products based on criteria, leveraging occasion_tags and style_tags.
+    All filters are evaluated in one pass over the catalog columns; only the returned products are materialized.
+    Returns a list of products shuffled with a seed derived from the criteria and `shuffle_round`, so repeating
+    a search builds the same prompt and is answered from the response cache, while a new round draws a new pool.
+    """
+    gender_matches = None
+    if 'gender' in criteria and criteria['gender'] and criteria['gender'].lower() != 'any':
+        gender = criteria['gender'].lower()
+        gender_matches = lambda value: value == gender
+
+    category_matches = None
+    if 'category' in criteria and criteria['category'] and criteria['category'].lower() != 'any' and criteria[
+        'category'].lower() != 'full outfit':
+        category = criteria['category'].lower()
+        category_matches = lambda value: value == category
+
+    color_matches = None
+    if 'color' in criteria and criteria['color'] and criteria['color'].lower() != 'any':
+        # Colors match by substring, e.g. "blue" matches "Navy Blue".
+        color = criteria['color'].lower()
+        color_matches = lambda value: color in value
+
+    mask = np.empty(len(products_data), dtype=bool)
+    filter_rows(catalog['prices'], catalog['gender_codes'], catalog['category_codes'], catalog['color_codes'],
+                tag_mask(catalog['occasion_bits'], catalog['occasion_idx'], criteria.get('occasion_tags')),
+                tag_mask(catalog['style_bits'], catalog['style_idx'], criteria.get('style_tags')),
+                criteria['max_price'] if 'max_price' in criteria else np.inf,
+                allowed_values(catalog['gender_values'], gender_matches),
+                allowed_values(catalog['category_values'], category_matches),
+                allowed_values(catalog['color_values'], color_matches),
+                mask)
+
+    found_ids = np.flatnonzero(mask)
+    rng = np.random.default_rng((zlib.crc32(json.dumps(criteria, sort_keys=True).encode('utf-8')), shuffle_round))
+    rng.shuffle(found_ids)
+    return [products_data[i] for i in found_ids[:num_results]]
 
 
 st.title("👗 AI Style Advisor")
@@ -86,28 +250,24 @@ with col1:
     user_style = st.text_input("What style do you prefer?", "")
     user_budget = st.slider("What's your budget (PLN)?", 50, 2000, 500)
 
-    gender_options = ['Any'] + sorted(
-        list(set([p['gender'] for p in products_data if p['gender'] != 'unspecified gender'])))
-    user_gender = st.selectbox("For whom?", gender_options)
-
-    category_options = ['Full outfit', 'Any'] + sorted(
-        list(set([p['category'] for p in products_data if p['category'] != 'unspecified category'])))
-    user_category = st.selectbox("What type of clothing are you looking for?", category_options)
+    user_gender = st.selectbox("For whom?", catalog['gender_options'])
+    user_category = st.selectbox("What type of clothing are you looking for?", catalog['category_options'])
 
 with col2:
     st.header("Additional preferences")
     user_color = st.text_input("Preferred color?", "")
     user_keywords = st.text_area("Other keywords / details?", "")
 
-    all_occasion_tags = sorted(
-        list(set([tag for p in products_data for tag in p.get('occasion_tags', []) if p.get('occasion_tags')])))
-    selected_occasion_tags = st.multiselect("Filter by occasion tags:", all_occasion_tags)
+    selected_occasion_tags = st.multiselect("Filter by occasion tags:", catalog['occasion_tags'])
+    selected_style_tags = st.multiselect("Filter by style tags:", catalog['style_tags'])
 
-    all_style_tags = sorted(
-        list(set([tag for p in products_data for tag in p.get('style_tags', []) if p.get('style_tags')])))
-    selected_style_tags = st.multiselect("Filter by style tags:", all_style_tags)
+find_outfit = st.button("Find me an outfit!")
+if st.button("Show me something different"):
+    # Same search, new shuffle: draws another product pool instead of repeating the cached suggestion.
+    st.session_state.shuffle_round = st.session_state.get('shuffle_round', 0) + 1
+    find_outfit = True
 
-if st.button("Find me an outfit!"):
+if find_outfit:
     with st.spinner("AI is analyzing your preferences and searching for the ideal styling..."):
 
         retrieval_criteria = {
@@ -120,29 +280,21 @@ if st.button("Find me an outfit!"):
         }
 
         potential_products = find_products_by_criteria(retrieval_criteria,
-                                                       num_results=30)
+                                                       num_results=30,
+                                                       shuffle_round=st.session_state.get('shuffle_round', 0))
 
         if not potential_products:
             st.warning(
                 "No potential products found in our database matching your initial criteria. Try broadening your search.")
             st.stop()
 
-        products_context = ""
-        for i, prod in enumerate(potential_products):
-            products_context += f"""
-            Product {i + 1}:
-            - Name: {prod['product_name']}
-            - Description: {prod['description']}
-            - Category: {prod['category']}
-            - Subcategory: {prod['sub_category']}
-            - Color: {prod['color']}
-            - Brand: {prod['brand']}
-            - Price: {prod['price']} {prod['currency']}
-            - Image URL: {prod['image_url']}
-            - Purchase Link: {prod['purchase_link']}
-            - Occasion Tags: {', '.join(prod.get('occasion_tags', []))}
-            - Style Tags: {', '.join(prod.get('style_tags', []))}
-            """
+        products_context = "".join(
+            PRODUCT_CONTEXT_TEMPLATE.format(
+                number=i + 1, name=prod['product_name'], description=prod['description'], category=prod['category'],
+                sub_category=prod['sub_category'], color=prod['color'], brand=prod['brand'], price=prod['price'],
+                currency=prod['currency'], image_url=prod['image_url'], purchase_link=prod['purchase_link'],
+                occasion_tags=', '.join(prod.get('occasion_tags', [])), style_tags=', '.join(prod.get('style_tags', [])))
+            for i, prod in enumerate(potential_products))
 
         budget_instruction = ""
         if user_category == "Full outfit":
@@ -173,50 +325,24 @@ if st.button("Find me an outfit!"):
         2.  Describe why you chose this styling and what elements it consists of.
         3.  **Crucially, select 3-5 specific products from the "Available Products" list (or 1 product if "Clothing Type" is specific).**
         4.  For "Full outfit", ensure the total price of selected products does not exceed the user's budget.
-        5.  For each selected product, provide its exact details **as they appear in the "Available Products" list (especially 'Name', 'Image URL', 'Purchase Link', 'Price')**.
+        5.  Identify each selected product only by its number in the "Available Products" list (e.g. 3 for "Product 3"); do not repeat its details.
 
         **Response Format (very important - MUST be a valid JSON object):**
-        ```json
         {{
           "overall_styling_proposal": "[Here, the styling description]",
-          "suggested_products": [
-            {{
-              "name": "[Product Name 1, EXACTLY from available products]",
-              "description": "[Brief description, you can generate this or use from available products]",
-              "color": "[Color, EXACTLY from available products]",
-              "category": "[Category, EXACTLY from available products]",
-              "price": [Price in PLN, EXACTLY from available products],
-              "image_url": "[Image URL, EXACTLY from available products]",
-              "purchase_link": "[Purchase Link, EXACTLY from available products]"
-            }},
-            {{
-              "name": "[Product Name 2, EXACTLY from available products]",
-              "description": "[Brief description, you can generate this or use from available products]",
-              "color": "[Color, EXACTLY from available products]",
-              "category": "[Category, EXACTLY from available products]",
-              "price": [Price in PLN, EXACTLY from available products],
-              "image_url": "[Image URL, EXACTLY from available products]",
-              "purchase_link": "[Purchase Link, EXACTLY from available products]"
-            }}
-            // ... up to 5 products
-          ]
+          "suggested_ids": [3, 7, 12]
         }}
-        ```
-        Ensure the JSON is valid and only includes products from the provided "Available Products" list.
+        Ensure the JSON is valid and only includes numbers of products from the provided "Available Products" list.
         """
 
         try:
-            response = model.generate_content(prompt)
-            ai_raw_response = response.text
-
-            json_match = re.search(r'```json\n({.*?})\n```', ai_raw_response, re.DOTALL)
+            ai_raw_response = call_gemini(prompt, PROMPT_VERSION)
 
-            if json_match:
-                json_str = json_match.group(1)
-                parsed_data = json.loads(json_str)
+            parsed_data = parse_json_response(ai_raw_response, JSON_FENCE_PATTERN)
 
+            if parsed_data is not None:
                 overall_styling_proposal = parsed_data.get("overall_styling_proposal", "No styling proposal provided.")
-                suggested_products_from_ai = parsed_data.get("suggested_products", [])
+                suggested_ids = parsed_data.get("suggested_ids", [])
 
                 st.subheader("Proposal from Your AI Style Advisor:")
                 st.markdown(overall_styling_proposal)
@@ -226,17 +352,13 @@ if st.button("Find me an outfit!"):
                 total_cost_ai_suggested = 0.0
                 display_products = []
 
-
-                for ai_prod in suggested_products_from_ai:
-                    found_in_db = next((p for p in potential_products if
-                                        p['product_name'] == ai_prod['name'] and p['category'] == ai_prod['category']),
-                                       None)
-                    if found_in_db:
-                        display_products.append(found_in_db)
-                        total_cost_ai_suggested += found_in_db['price']
+                for product_id in dict.fromkeys(suggested_ids):
+                    if isinstance(product_id, int) and 1 <= product_id <= len(potential_products):
+                        display_products.append(potential_products[product_id - 1])
+                        total_cost_ai_suggested += potential_products[product_id - 1]['price']
                     else:
                         st.warning(
-                            f"AI suggested product '{ai_prod['name']}' not found in the initial pool. This might indicate an issue with AI's adherence to instructions.")
+                            f"AI suggested product number {product_id}, which is not in the initial pool. This might indicate an issue with AI's adherence to instructions.")
 
                 if user_category == "Full outfit" and display_products:
                     st.success(
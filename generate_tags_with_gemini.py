@@ -1,9 +1,15 @@
 import google.generativeai as genai
-import json
+from google.api_core import exceptions as google_exceptions
 import os
 import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 import re
+from json_io import dump_json, dumps_json_line, load_json, loads_json, parse_json_response
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from typing_extensions import TypedDict
 
 load_dotenv()
 
@@ -17,99 +23,251 @@ else:
     exit()
 
 
-model = genai.GenerativeModel('gemini-2.5-flash')
+class ProductTags(TypedDict):
+    id: int
+    occasion_tags: list[str]
+    style_tags: list[str]
+
+
+model = genai.GenerativeModel(
+    'gemini-2.5-flash',
+    generation_config=genai.GenerationConfig(response_mime_type="application/json",
+                                             response_schema=list[ProductTags]))
+
+JSON_FENCE_PATTERN = re.compile(r'```json\n([\[{].*?[\]}])\n```', re.DOTALL)
 
 INPUT_JSON_FILE = 'fashion_products.json'
 OUTPUT_JSON_FILE_TAGGED = 'fashion_products_tagged.json'
+PROGRESS_FILE_TAGGED = 'fashion_products_tagged.ndjson'  # One tagged product per line; lets interrupted runs resume.
 
 
 
 MAX_PRODUCTS_TO_PROCESS = 240  # Set to slightly less than daily limit to be safe.
-BATCH_SIZE = 5  # Process very small batches to avoid hitting per-minute limit.
-DELAY_BETWEEN_BATCHES = 30  # Wait 30 seconds after each batch of 5 products.
+BATCH_SIZE = 10  # Products tagged per request; raise while the time per product keeps dropping.
+REQUESTS_PER_MINUTE = 10  # Stay under the per-minute request limit.
+MAX_WORKERS = REQUESTS_PER_MINUTE  # More workers than this would only wait on the rate limiter.
+MAX_BATCH_SPLITS = 1  # Halvings allowed for a batch whose response doesn't match it; caps a batch at 3 requests.
 
 
-def generate_tags_for_product(product_info):
+class RateLimiter:
     """
-    Creates a prompt for Gemini and extracts style and occasion tags.
+    Allows at most `rpm` acquisitions in any rolling 60-second window, shared by all worker threads.
     """
-    prompt = f"""
-    Based on the following product description, generate a list of style tags and a list of occasion tags.
-    Tags should be relevant, concise (one or two words), and represent the character of the product.
-    Use English language.
 
-    **Product Description:**
+    def __init__(self, rpm):
+        self.lock = threading.Lock()
+        self.times = deque(maxlen=rpm)
+
+    def acquire(self):
+        with self.lock:
+            if len(self.times) == self.times.maxlen:
+                time.sleep(max(0.0, self.times[0] + 60 - time.monotonic()))
+            self.times.append(time.monotonic())
+
+
+rate_limiter = RateLimiter(REQUESTS_PER_MINUTE)
+
+TRANSIENT_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.ServiceUnavailable,
+    ConnectionError,
+)
+
+
+@retry(retry=retry_if_exception_type(TRANSIENT_ERRORS), stop=stop_after_attempt(5),
+       wait=wait_random_exponential(multiplier=1, max=60), reraise=True)
+def generate_content(prompt):
+    """
+    Sends a rate-limited request to Gemini.
+    Transient errors (rate limits, timeouts, 5xx, dropped connections) are retried with jittered exponential backoff.
+    Returns the response and the time Gemini took to answer it, excluding rate limiter waits and failed attempts.
+    """
+    rate_limiter.acquire()
+    start = time.monotonic()
+    response = model.generate_content(prompt)
+    return response, time.monotonic() - start
+
+
+def generate_tags_for_batch(products, splits_left=MAX_BATCH_SPLITS):
+    """
+    Creates a single prompt for a batch of products and extracts style and occasion tags for each of them.
+    Returns a list of (occasion_tags, style_tags) pairs in the same order as `products`,
+    with None for products whose request kept failing with transient errors or whose response couldn't be parsed,
+    so that they are retried by the next run instead of being saved without tags.
+    Entries are matched to products by id, or by position if there is one per product but they are misnumbered.
+    Otherwise the batch is split in half and retried, at most `splits_left` more times.
+    """
+    products_description = "\n".join(f"""
+    Product {i + 1}:
     Name: {product_info['product_name']}
     Category: {product_info['category']} ({product_info['sub_category']})
     Gender: {product_info['gender']}
     Color: {product_info['color']}
     Usage Type: {product_info['usage_type']}
-    Full description: {product_info['description']}
+    Full description: {product_info['description']}""" for i, product_info in enumerate(products))
+
+    prompt = f"""
+    Based on the following product descriptions, generate a list of style tags and a list of occasion tags for each product.
+    Tags should be relevant, concise (one or two words), and represent the character of the product.
+    Use English language.
+
+    **Product Descriptions:**
+    {products_description}
 
     **Instructions for Tags:**
     - Style Tags: Describe the aesthetic, e.g., elegant, casual, boho, minimalist, streetwear, sporty, retro, glamorous, classic, modern.
     - Occasion Tags: Describe for which events the product is suitable, e.g., date night, office, party, beach, travel, everyday, wedding, formal, casual.
     - Each list should contain between 2 and 5 tags.
+    - Return exactly one entry per product ({len(products)} in total), with "id" set to the product's number.
 
     **Response Format (JSON):**
-    ```json
-    {{
-      "occasion_tags": ["tag1", "tag2"],
-      "style_tags": ["tag1", "tag2"]
-    }}
-    ```
+    [
+      {{
+        "id": 1,
+        "occasion_tags": ["tag1", "tag2"],
+        "style_tags": ["tag1", "tag2"]
+      }}
+    ]
     """
 
+    names = ", ".join(f"'{product_info['product_name']}'" for product_info in products)
+    try:
+        response, elapsed = generate_content(prompt)
+    except TRANSIENT_ERRORS as e:
+        print(f"Gemini API Error for products {names}: {e}")
+        return [None for _ in products]
+
+    print(f"Gemini answered for {len(products)} products in {elapsed:.1f}s ({elapsed / len(products):.2f}s per product).")
+
     try:
-        response = model.generate_content(prompt)
         text_response = response.text
+    except ValueError:
+        # Raised when the response has no text, e.g. because it was blocked by safety filters.
+        text_response = ''
 
-        json_match = re.search(r'```json\n({.*?})\n```', text_response, re.DOTALL)
-        if json_match:
-            json_str = json_match.group(1)
-            parsed_data = json.loads(json_str)
-            return parsed_data.get('occasion_tags', []), parsed_data.get('style_tags', [])
-        else:
-            print(
-                f"Warning: Failed to parse JSON from Gemini's response for product: {product_info['product_name']}. Response: {text_response[:100]}...")
-            return [], []
-    except Exception as e:
-        print(f"Gemini API Error for product '{product_info['product_name']}': {e}")
-        return [], []
+    parsed_data = parse_json_response(text_response, JSON_FENCE_PATTERN)
+    entries = []
+    if isinstance(parsed_data, list):
+        entries = [entry for entry in parsed_data if isinstance(entry, dict)]
+    entries_by_id = {entry.get('id'): entry for entry in entries}
+
+    if set(entries_by_id) == set(range(1, len(products) + 1)):
+        entries = [entries_by_id[i + 1] for i in range(len(products))]
+    if len(entries) == len(products):
+        return [(entry.get('occasion_tags', []), entry.get('style_tags', [])) for entry in entries]
+
+    if len(products) > 1 and splits_left > 0:
+        print(f"Warning: Gemini's response didn't match the batch of {len(products)} products. Retrying in halves...")
+        middle = len(products) // 2
+        return (generate_tags_for_batch(products[:middle], splits_left - 1)
+                + generate_tags_for_batch(products[middle:], splits_left - 1))
+
+    print(f"Warning: Failed to parse JSON from Gemini's response for products: {names}. Response: {text_response[:100]}...")
+    return [None for _ in products]
 
 
-def process_products_for_tags(input_file, output_file, max_products_to_process, batch_size, delay):
+def tag_batch(products):
     """
-    Loads products, generates tags using Gemini, and saves updated products.
+    Generates tags for a batch of products and stores them on each product.
+    Returns the successfully tagged products; the others are left for the next run.
     """
-    try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            products = json.load(f)
+    tagged_products = []
+    for product, tags in zip(products, generate_tags_for_batch(products)):
+        if tags is None:
+            continue
+        occasion_tags, style_tags = tags
+        product['occasion_tags'] = list(dict.fromkeys(occasion_tags))
+        product['style_tags'] = list(dict.fromkeys(style_tags))
+        tagged_products.append(product)
+    return tagged_products
 
-        print(f"Loaded {len(products)} products from '{input_file}'.")
 
-        products_to_process = products[:min(len(products), max_products_to_process)]
-        print(f"Processing a maximum of {len(products_to_process)} products for tags.")
+def product_key(product):
+    """
+    Identifies a product the same way the data preparation step deduplicates them.
+    """
+    return product['product_name'], product['category'], product['color']
 
-        updated_products = []
-        for i, product in enumerate(products_to_process):
-            print(f"Processing product {i + 1}/{len(products_to_process)}: {product['product_name']}")
 
-            occasion_tags, style_tags = generate_tags_for_product(product)
+def load_tagged_products(progress_file):
+    """
+    Loads the products tagged by previous runs from the NDJSON progress file.
+    A partially written last line, left by an interrupted run, is dropped from the file.
+    """
+    tagged_products = []
+    if not os.path.exists(progress_file):
+        return tagged_products
+
+    with open(progress_file, 'r+b') as f:
+        valid_end = 0
+        while line := f.readline():
+            if not line.endswith(b'\n'):
+                break
+            try:
+                tagged_products.append(loads_json(line))
+            except ValueError:
+                break
+            valid_end = f.tell()
+        f.truncate(valid_end)
+    return tagged_products
+
+
+def process_products_for_tags(input_file, output_file, progress_file, max_products_to_process, batch_size,
+                              max_workers):
+    """
+    Loads products, generates tags using Gemini, and saves updated products.
+    Every tagged product is appended to `progress_file` as soon as its batch is ready, and products already in it
+    are skipped, so an interrupted or quota-limited run can simply be restarted. A non-transient API error cancels
+    the batches not yet sent, while those in flight are still saved. All tagged products are then written to
+    `output_file`, even if the run stopped early.
+    """
+    try:
+        products = load_json(input_file)
 
-            product['occasion_tags'] = list(set(occasion_tags))
-            product['style_tags'] = list(set(style_tags))
+        print(f"Loaded {len(products)} products from '{input_file}'.")
+
+        tagged_products = load_tagged_products(progress_file)
+        done = {product_key(product) for product in tagged_products}
+        if tagged_products:
+            print(f"Resuming: {len(tagged_products)} products were already tagged in '{progress_file}'.")
 
-            updated_products.append(product)
+        pending = [product for product in products if product_key(product) not in done]
+        products_to_process = pending[:min(len(pending), max_products_to_process)]
+        print(f"Processing a maximum of {len(products_to_process)} products for tags.")
 
-            if (i + 1) % batch_size == 0:
-                print(f"Batch {i + 1} reached. Waiting {delay} seconds before the next batch...")
-                time.sleep(delay)
+        batches = [products_to_process[i:i + batch_size] for i in range(0, len(products_to_process), batch_size)]
 
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(updated_products, f, ensure_ascii=False, indent=2)
+        try:
+            with open(progress_file, 'ab') as f, ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(tag_batch, batch) for batch in batches]
+                error = None
+                for future in as_completed(futures):
+                    if future.cancelled():
+                        continue
+                    if future.exception() is not None:
+                        if error is None:
+                            # A non-transient error (e.g. an invalid API key) would fail every remaining batch too.
+                            error = future.exception()
+                            for pending_future in futures:
+                                pending_future.cancel()
+                        continue
+                    for product in future.result():
+                        f.write(dumps_json_line(product))
+                        tagged_products.append(product)
+                    f.flush()
+                    print(f"Saved {len(tagged_products)} tagged products so far.")
+                if error is not None:
+                    raise error
+        finally:
+            # Batches finish out of order; keep the consolidated file in the input order.
+            position = {product_key(product): i for i, product in enumerate(products)}
+            tagged_products.sort(key=lambda product: position.get(product_key(product), len(position)))
+            dump_json(tagged_products, output_file)
+            print(f"Updated products saved to '{output_file}'.")
 
-        print(f"Processing finished. Updated products saved to '{output_file}'.")
+        print("Processing finished.")
 
     except FileNotFoundError:
         print(f"Error: File '{input_file}' not found.")
@@ -118,5 +276,5 @@ def process_products_for_tags(input_file, output_file, max_products_to_process,
 
 
 if __name__ == "__main__":
-    process_products_for_tags(INPUT_JSON_FILE, OUTPUT_JSON_FILE_TAGGED, MAX_PRODUCTS_TO_PROCESS, BATCH_SIZE,
-                              DELAY_BETWEEN_BATCHES)
\ No newline at end of file
+    process_products_for_tags(INPUT_JSON_FILE, OUTPUT_JSON_FILE_TAGGED, PROGRESS_FILE_TAGGED, MAX_PRODUCTS_TO_PROCESS,
+                              BATCH_SIZE, MAX_WORKERS)
\ No newline at end of file
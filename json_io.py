@@ -0,0 +1,69 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def load_json(path):
+    """
+    Loads a JSON file, using orjson when it is installed.
+    """
+    if orjson is not None:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def loads_json(data):
+    """
+    Parses JSON from a str or bytes, using orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def parse_json_response(text, fence_pattern):
+    """
+    Parses a model's JSON response, falling back to the fenced block captured by `fence_pattern`
+    if the model wrapped the JSON in one anyway. Returns None if no valid JSON can be extracted.
+    """
+    try:
+        return loads_json(text)
+    except ValueError:
+        json_match = fence_pattern.search(text)
+        if not json_match:
+            return None
+        try:
+            return loads_json(json_match.group(1))
+        except ValueError:
+            return None
+
+
+def dumps_json(obj):
+    """
+    Serializes an object to indented UTF-8 JSON bytes, using orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+def dumps_json_line(obj):
+    """
+    Serializes an object to a single line of compact UTF-8 JSON bytes, terminated by a newline (NDJSON).
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8') + b'\n'
+
+
+def dump_json(obj, path):
+    """
+    Writes an object to a JSON file.
+    """
+    with open(path, 'wb') as f:
+        f.write(dumps_json(obj))
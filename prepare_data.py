@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
-import json
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv as pa_csv
 import re
 
 INPUT_STYLES_CSV_FILE = 'styles.csv'
@@ -10,53 +12,78 @@ OUTPUT_JSON_FILE = 'fashion_products.json'
 MIN_PRICE = 49.00
 MAX_PRICE = 399.00
 CURRENCY = "PLN"
+RNG = np.random.default_rng(0)  # Fixed seed so regenerating the file yields the same dummy prices.
 
+NON_ALNUM_PATTERN = re.compile(r'[^a-z0-9\s-]')
+WHITESPACE_PATTERN = re.compile(r'\s+')
 
-def clean_product_name_for_url(name):
-    """Cleans product name to be suitable for URL."""
-    if pd.isna(name):
-        return "unnamed-product"
-    name = str(name).lower()
-    name = re.sub(r'[^a-z0-9\s-]', '', name)
-    name = re.sub(r'\s+', '-', name)
-    name = name.strip('-')
-    return name if name else "unnamed-product"
+STYLES_COLUMN_NAMES = {
+    'id': 'id',
+    'productDisplayName': 'product_name',
+    'articleType': 'category',
+    'baseColour': 'color',
+    'subCategory': 'sub_category',
+    'masterCategory': 'master_category',
+    'gender': 'gender',
+    'year': 'collection_year',
+    'season': 'season',
+    'usage': 'usage_type',
+}
+CATEGORICAL_COLUMNS = ['category', 'sub_category', 'master_category', 'gender', 'color', 'season', 'usage_type']
 
 
-def extract_id_from_filename(filename):
-    if pd.isna(filename):
-        return None
-    return str(filename).split('.')[0]
+def clean_product_names_for_url(names):
+    """Cleans a Series of product names to be suitable for URLs."""
+    slugs = (names.fillna('').astype(str).str.lower()
+             .str.replace(NON_ALNUM_PATTERN, '', regex=True)
+             .str.replace(WHITESPACE_PATTERN, '-', regex=True)
+             .str.strip('-'))
+    return slugs.mask(slugs == '', "unnamed-product")
+
+
+def concat_strings(*parts):
+    """Concatenates Series (of any dtype) and literal strings element-wise in a single Arrow pass."""
+    index = next(part.index for part in parts if isinstance(part, pd.Series))
+    arrays = [pc.cast(pa.array(part), pa.string()) if isinstance(part, pd.Series) else part for part in parts]
+    return pd.Series(pd.arrays.ArrowExtensionArray(pc.binary_join_element_wise(*arrays, '')), index=index)
+
+
+def empty_tag_lists(length):
+    """Creates `length` empty tag lists as one Arrow list<string> array instead of a Python list per row."""
+    return pd.arrays.ArrowExtensionArray(
+        pa.ListArray.from_arrays(np.zeros(length + 1, dtype=np.int32), pa.array([], type=pa.string())))
 
 
 def prepare_fashion_data(input_styles_path, input_images_path, output_json_path):
     try:
         print(f"Loading styles data from: {input_styles_path}")
-        df_styles = pd.read_csv(input_styles_path, on_bad_lines='skip', dtype={'id': str})
-
-        print(f"Loading images data from: {input_images_path}")
-        df_images = pd.read_csv(input_images_path, on_bad_lines='skip', dtype={'filename': str, 'link': str})
-
-        df_images['product_id'] = df_images['filename'].apply(extract_id_from_filename)
-        df_images = df_images.rename(columns={'link': 'image_url'})
+        # Header names are matched after stripping whitespace, so only the needed columns are ever parsed.
+        styles_columns = {col.strip(): col for col in pd.read_csv(input_styles_path, nrows=0).columns
+                          if col.strip() in STYLES_COLUMN_NAMES}
+        # Every column is typed as text up front; pandas' dtype=str would only cast after PyArrow inferred int64,
+        # dropping the ids' leading zeros. Blank years reach the to_numeric fallback below.
+        df_styles = pa_csv.read_csv(
+            input_styles_path,
+            parse_options=pa_csv.ParseOptions(invalid_row_handler=lambda row: 'skip'),
+            convert_options=pa_csv.ConvertOptions(include_columns=list(styles_columns.values()),
+                                                  column_types={col: pa.string() for col in styles_columns.values()},
+                                                  strings_can_be_null=True)).to_pandas()
 
         df_styles.columns = df_styles.columns.str.strip()
-        df_styles = df_styles.rename(columns={
-            'productDisplayName': 'product_name',
-            'articleType': 'category',
-            'baseColour': 'color',
-            'subCategory': 'sub_category',
-            'masterCategory': 'master_category',
-            'gender': 'gender',
-            'year': 'collection_year',
-            'season': 'season',
-            'usage': 'usage_type',
-        })
+        df_styles = df_styles.rename(columns=STYLES_COLUMN_NAMES)
 
         initial_num_products = len(df_styles)
         df_styles = df_styles[df_styles['master_category'].str.lower() == 'apparel']
         print(f"Originally {initial_num_products} products, after filtering for apparel: {len(df_styles)}.")
 
+        print(f"Loading images data from: {input_images_path}")
+        df_images = pd.read_csv(input_images_path, engine='pyarrow', on_bad_lines='skip',
+                                dtype={'filename': str, 'link': str})
+
+        df_images['product_id'] = df_images['filename'].str.split('.', n=1).str[0]
+        image_urls = (df_images.drop_duplicates(subset=['product_id'], keep='first')
+                      .set_index('product_id')['link'].rename('image_url'))
+
         desired_styles_columns = [
             'id',
             'product_name', 'category', 'sub_category', 'master_category',
@@ -64,45 +91,47 @@ def prepare_fashion_data(input_styles_path, input_images_path, output_json_path)
         ]
         df_styles = df_styles[desired_styles_columns]
 
-        for col in ['product_name', 'category', 'sub_category', 'master_category',
-                    'gender', 'color', 'collection_year', 'season', 'usage_type']:
-            df_styles[col] = df_styles[col].fillna(
-                f'unspecified {col.replace("_", " ")}')
+        fill_values = {col: f'unspecified {col.replace("_", " ")}' for col in desired_styles_columns[1:]}
+        df_styles = df_styles.fillna(value=fill_values)
+        df_styles = df_styles.astype({col: 'category' for col in CATEGORICAL_COLUMNS})
 
         df_styles['collection_year'] = pd.to_numeric(df_styles['collection_year'], errors='coerce').fillna(2020).astype(
             int)
 
-        df_images_unique = df_images.drop_duplicates(subset=['product_id'], keep='first')
-
         print("Merging styles data with images...")
-        df_merged = pd.merge(df_styles, df_images_unique[['product_id', 'image_url']], left_on='id',
-                             right_on='product_id', how='left')
+        df_merged = df_styles.join(image_urls, on='id')
 
         df_merged['image_url'] = df_merged['image_url'].fillna('https://via.placeholder.com/150?text=No+Image')
 
-        df_merged.drop(columns=['id', 'product_id'], inplace=True)
+        df_merged.drop(columns=['id'], inplace=True)
+
+        dedup_key = df_merged['product_name'].str.lower().str.cat(
+            [df_merged['category'].str.lower(), df_merged['color'].str.lower()], sep='|')
+        df_merged = df_merged[~dedup_key.duplicated()]
 
         print("Generating dummy prices, store links, and tags...")
 
-        df_merged['price'] = np.random.uniform(low=MIN_PRICE, high=MAX_PRICE, size=len(df_merged)).round(2)
+        prices = RNG.uniform(MIN_PRICE, MAX_PRICE, size=len(df_merged))
+        np.round(prices, 2, out=prices)
+        df_merged['price'] = prices
         df_merged['currency'] = CURRENCY
 
         df_merged['brand'] = "Unknown Brand"
 
-        df_merged['product_slug'] = df_merged['product_name'].apply(clean_product_name_for_url)
-        df_merged['purchase_link'] = df_merged.apply(
-            lambda
-                row: f"https://yourboutique.com/{row['master_category'].lower().replace(' ', '-')}/{row['category'].lower().replace(' ', '-')}/{row['product_slug']}",
-            axis=1
-        )
+        df_merged['product_slug'] = clean_product_names_for_url(df_merged['product_name'])
+        master_category_slug = df_merged['master_category'].str.lower().str.replace(' ', '-', regex=False)
+        category_slug = df_merged['category'].str.lower().str.replace(' ', '-', regex=False)
+        df_merged['purchase_link'] = concat_strings("https://yourboutique.com/", master_category_slug, "/", category_slug,
+                                                    "/", df_merged['product_slug'])
 
-        df_merged['occasion_tags'] = [[] for _ in range(len(df_merged))]
-        df_merged['style_tags'] = [[] for _ in range(len(df_merged))]
+        df_merged['occasion_tags'] = empty_tag_lists(len(df_merged))
+        df_merged['style_tags'] = empty_tag_lists(len(df_merged))
 
-        df_merged['description'] = df_merged.apply(
-            lambda
-                row: f"{row['product_name']} in {row['color']} from {row['brand']}, intended for {row['gender']}. Category: {row['category']}, subcategory: {row['sub_category']}. Usage type: {row['usage_type']}. Collection year: {row['collection_year']}.",
-            axis=1
+        df_merged['description'] = concat_strings(
+            df_merged['product_name'], " in ", df_merged['color'], " from ", df_merged['brand'],
+            ", intended for ", df_merged['gender'], ". Category: ", df_merged['category'],
+            ", subcategory: ", df_merged['sub_category'], ". Usage type: ", df_merged['usage_type'],
+            ". Collection year: ", df_merged['collection_year'], "."
         )
 
         final_columns = [
@@ -112,16 +141,13 @@ def prepare_fashion_data(input_styles_path, input_images_path, output_json_path)
         ]
         df_final = df_merged[final_columns]
 
-        df_final.drop_duplicates(subset=['product_name', 'category', 'color'], inplace=True)
-
-        products_list = df_final.to_dict(orient='records')
-
         print(f"Saving processed data to: {output_json_path}")
-        with open(output_json_path, 'w', encoding='utf-8') as f:
-            json.dump(products_list, f, ensure_ascii=False, indent=2)
+        # Parses to the same data as json.dump, but isn't byte-identical: '/' is escaped as '\/', there is no space
+        # after ':', and empty tag lists are written across two lines.
+        df_final.to_json(output_json_path, orient='records', force_ascii=False, indent=2)
 
         print(
-            f"Data successfully processed and saved to {output_json_path}. Number of unique products: {len(products_list)}")
+            f"Data successfully processed and saved to {output_json_path}. Number of unique products: {len(df_final)}")
 
     except FileNotFoundError as fnf_error:
         print(
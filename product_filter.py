@@ -0,0 +1,33 @@
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+if njit is not None:
+    @njit(cache=True)
+    def filter_rows(prices, gender_codes, category_codes, color_codes, occasion_match, style_match,
+                    max_price, gender_allowed, category_allowed, color_allowed, out_mask):
+        """
+        Evaluates every product predicate in a single fused pass over the catalog columns, writing into `out_mask`.
+        Runs serially: Streamlit calls it from one thread per session, which Numba's parallel backends
+        don't all tolerate, and the catalog is too small for parallel scheduling to pay off.
+        """
+        for i in range(prices.shape[0]):
+            out_mask[i] = (prices[i] <= max_price and gender_allowed[gender_codes[i]]
+                           and category_allowed[category_codes[i]] and color_allowed[color_codes[i]]
+                           and occasion_match[i] and style_match[i])
+else:
+    def filter_rows(prices, gender_codes, category_codes, color_codes, occasion_match, style_match,
+                    max_price, gender_allowed, category_allowed, color_allowed, out_mask):
+        """
+        Evaluates every product predicate with vectorized numpy operations, writing into `out_mask`.
+        """
+        np.less_equal(prices, max_price, out=out_mask)
+        out_mask &= gender_allowed[gender_codes]
+        out_mask &= category_allowed[category_codes]
+        out_mask &= color_allowed[color_codes]
+        out_mask &= occasion_match
+        out_mask &= style_match